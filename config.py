@@ -18,11 +18,19 @@ MODELS_DIR.mkdir(exist_ok=True)
 # YOLO model configuration
 YOLO_MODEL = "yolov8n.pt"  # Nano model for speed
 YOLO_MODEL_PATH = MODELS_DIR / YOLO_MODEL
+YOLO_ENGINE_PATH = YOLO_MODEL_PATH.with_suffix(".engine")  # TensorRT FP16 (export_once.py)
+BIRD_CLASS_ID = 14  # "bird" in the COCO classes YOLOv8 is trained on
+DETECTOR_DEVICE = None  # None = CUDA (FP16) when available, else CPU (FP32)
+DETECTOR_IMGSZ = 640  # Inference size; larger frames are downscaled before inference
+DETECTOR_OPENCL_RESIZE = True  # Downscale through cv2.UMat (OpenCL) when a device is available
 
 # Detection parameters (defaults)
 DEFAULT_CONF_THRESH = 0.25
 DEFAULT_IOU_THRESH = 0.45
 DEFAULT_FPS_SAMPLE = 5  # Process every 5th frame
+DEFAULT_BATCH_SIZE = 16  # Sampled frames per detector forward pass
+PIPELINE_PREFETCH_BATCHES = 2  # Decoded batches the reader thread may run ahead
+PIPELINE_QUEUE_SIZE = 8  # Tracked frames waiting for the writer thread
 
 # Tracking parameters
 TRACK_THRESH = 0.5  # High confidence track threshold
@@ -37,11 +45,34 @@ MIN_BOX_AREA = 100  # Minimum bounding box area (pixels)
 # API settings
 API_HOST = "0.0.0.0"
 API_PORT = 8000
+DEV_MODE = os.getenv("DEV", "0") == "1"  # Auto-reload on code changes (single worker)
+API_WORKERS = int(os.getenv("WORKERS", "2"))  # Server processes, each with its own PROCESS_WORKERS pool
+# Video-processing worker processes per server process, each loading its own
+# model (one per GPU or a few CPU cores); WORKERS * PROCESS_WORKERS models in total
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", "1"))
 MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # 500 MB
+STREAM_RESPONSE_MIN_TRACKS = 1000  # Stream the JSON reply above this many tracks
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MB copy buffer for uploads
+UPLOAD_TO_MEMORY = True  # Keep uploads in a RAM-backed memfd on Linux instead of a temp file
+
+# Video input settings
+VIDEO_HW_DECODE = True  # Try hardware-accelerated decode, fall back to software
+# Explicit FFmpeg capture options tried first, e.g. NVDEC for H.264 CCTV streams:
+# "hwaccel;cuda|video_codec;h264_cuvid". Empty = let OpenCV pick the accelerator
+VIDEO_HW_CAPTURE_OPTIONS = os.getenv("VIDEO_HW_CAPTURE_OPTIONS", "")
 
 # Video output settings
-VIDEO_CODEC = "mp4v"
+VIDEO_CODEC = "mp4v"  # OpenCV fallback when no FFmpeg encoder is usable
 OUTPUT_FPS = 30
+VIDEO_FFMPEG_ENCODE = True  # Pipe annotated frames to an ffmpeg subprocess for H.264 encode
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# FFmpeg encoders tried in order with their options: NVENC first, then CPU x264
+VIDEO_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4"],
+    "libx264": ["-preset", "ultrafast"],
+}
+RENDER_WORKERS = os.cpu_count() or 1  # Threads drawing annotations in create_annotated_video
+RENDER_QUEUE_SIZE = 16  # Frames decoded/rendering ahead of the video writer
 
 # Visualization settings
 BOX_COLOR = (0, 255, 0)  # Green
@@ -3,13 +3,23 @@ Quick demonstration script to test the API
 """
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Reuse one pooled connection for all demo requests
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                                     max_retries=Retry(total=3, backoff_factor=0.3)))
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 300)
 
 # Test 1: Health endpoint
 print("=" * 60)
 print("TEST 1: Health Check")
 print("=" * 60)
 try:
-    response = requests.get("http://localhost:8000/health")
+    response = session.get("http://localhost:8000/health", timeout=TIMEOUT)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
     print("✓ Health check passed!")
@@ -20,7 +30,7 @@ print("\n" + "=" * 60)
 print("TEST 2: Root Endpoint")
 print("=" * 60)
 try:
-    response = requests.get("http://localhost:8000/")
+    response = session.get("http://localhost:8000/", timeout=TIMEOUT)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
     print("✓ Root endpoint test passed!")
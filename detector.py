@@ -3,15 +3,32 @@ Bird detection using YOLOv8
 """
 import cv2
 import numpy as np
+import torch
 from ultralytics import YOLO
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 import logging
 
-from config import YOLO_MODEL, DEFAULT_CONF_THRESH, DEFAULT_IOU_THRESH
+from config import (
+    YOLO_MODEL, YOLO_MODEL_PATH, YOLO_ENGINE_PATH, DEFAULT_CONF_THRESH, DEFAULT_IOU_THRESH, 
+    DEFAULT_BATCH_SIZE, DETECTOR_DEVICE, DETECTOR_IMGSZ, DETECTOR_OPENCL_RESIZE, BIRD_CLASS_ID
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _resolve_model_path(device: str) -> str:
+    """
+    Pick the fastest available weights: a pre-exported TensorRT engine 
+    (CUDA only), then weights pre-placed in MODELS_DIR, then the default 
+    model name (downloaded by Ultralytics if missing)
+    """
+    if device != 'cpu' and YOLO_ENGINE_PATH.exists():
+        return str(YOLO_ENGINE_PATH)
+    if YOLO_MODEL_PATH.exists():
+        return str(YOLO_MODEL_PATH)
+    return YOLO_MODEL
+
+
 class BirdDetector:
     """
     Bird detection using YOLOv8 pretrained model.
@@ -19,22 +36,54 @@ class BirdDetector:
     """
     
     def __init__(self, conf_thresh: float = DEFAULT_CONF_THRESH, 
-                 iou_thresh: float = DEFAULT_IOU_THRESH):
+                 iou_thresh: float = DEFAULT_IOU_THRESH,
+                 device: Optional[str] = DETECTOR_DEVICE):
         """
         Initialize bird detector
         
         Args:
             conf_thresh: Confidence threshold for detections
             iou_thresh: IoU threshold for NMS
+            device: Inference device ('cpu', 'cuda:0', ...); None selects CUDA when available
         """
         self.conf_thresh = conf_thresh
         self.iou_thresh = iou_thresh
         
-        logger.info(f"Loading YOLOv8 model: {YOLO_MODEL}")
-        self.model = YOLO(YOLO_MODEL)
-        logger.info("YOLOv8 model loaded successfully")
+        if device is None:
+            device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+        self.device = device
+        # FP16 halves memory traffic on CUDA; the CPU path stays FP32
+        self.half = self.device != 'cpu'
+        # Only pass the FP16 flag when it is set; recent Ultralytics versions
+        # warn on every call that passes `half`
+        self._predict_options = {'half': True} if self.half else {}
+        self.imgsz = DETECTOR_IMGSZ
+        # Full-resolution frames are shrunk on the OpenCL device if there is one
+        self.use_opencl = DETECTOR_OPENCL_RESIZE and cv2.ocl.haveOpenCL()
+        
+        model_path = _resolve_model_path(self.device)
+        logger.info(f"Loading YOLOv8 model: {model_path}")
+        self.model = YOLO(model_path)
+        if not model_path.endswith('.engine'):
+            # TensorRT engines are already fused and bound to their device
+            self.model.to(self.device)
+            self.model.fuse()
+        logger.info(f"YOLOv8 model loaded successfully on {self.device} "
+                    f"({'FP16' if self.half else 'FP32'}, "
+                    f"{'OpenCL' if self.use_opencl else 'CPU'} resize)")
+        
+    def warmup(self, imgsz: int = 640):
+        """
+        Run a dummy inference so weight loading and kernel autotuning
+        happen now instead of on the first real request
+        
+        Args:
+            imgsz: Side length of the blank warm-up frame
+        """
+        logger.info("Warming up YOLOv8 model")
+        self.detect(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
         
-    def detect(self, frame: np.ndarray) -> List[List]:
+    def detect(self, frame: np.ndarray) -> np.ndarray:
         """
         Detect birds in frame
         
@@ -42,20 +91,76 @@ class BirdDetector:
             frame: Input image frame
             
         Returns:
-            List of detections [x1, y1, x2, y2, confidence]
-        """
-        # Run detection
-        results = self.model(frame, conf=self.conf_thresh, 
-                           iou=self.iou_thresh, verbose=False)
-        
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Filter for bird class (class 14 in COCO dataset)
-                if int(box.cls) == 14:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    conf = float(box.conf)
-                    detections.append([x1, y1, x2, y2, conf])
-        
-        return detections
+            (N, 5) float32 array of detections [x1, y1, x2, y2, confidence]
+        """
+        return self.detect_batch([frame])[0]
+    
+    def detect_batch(self, frames: List[np.ndarray], 
+                     batch_size: int = DEFAULT_BATCH_SIZE,
+                     conf_thresh: Optional[float] = None,
+                     iou_thresh: Optional[float] = None) -> List[np.ndarray]:
+        """
+        Detect birds in a batch of frames with a single forward pass per chunk
+        
+        Args:
+            frames: List of input image frames
+            batch_size: Maximum number of frames per forward pass
+            conf_thresh: Per-call confidence threshold (defaults to the detector's)
+            iou_thresh: Per-call NMS IoU threshold (defaults to the detector's)
+            
+        Returns:
+            List (one entry per frame) of (N, 5) float32 detection arrays 
+            [x1, y1, x2, y2, confidence]
+        """
+        conf_thresh = self.conf_thresh if conf_thresh is None else conf_thresh
+        iou_thresh = self.iou_thresh if iou_thresh is None else iou_thresh
+        all_detections = []
+        
+        for start in range(0, len(frames), batch_size):
+            inputs, scales = zip(*(self._downscale(frame) 
+                                   for frame in frames[start:start + batch_size]))
+            
+            # Ultralytics accepts a list of frames and returns one result per frame
+            results = self.model(list(inputs), imgsz=self.imgsz,
+                               conf=conf_thresh, iou=iou_thresh, 
+                               classes=[BIRD_CLASS_ID], device=self.device, 
+                               verbose=False, **self._predict_options)
+            
+            # Only bird boxes are returned, so each result copies back 
+            # in one transfer. boxes.data rows are [x1, y1, x2, y2, conf, cls]
+            for result, scale in zip(results, scales):
+                detections = result.boxes.data[:, :5].float().cpu().numpy()
+                if scale is not None:
+                    # Map boxes back to full-resolution coordinates
+                    detections[:, [0, 2]] *= scale[0]
+                    detections[:, [1, 3]] *= scale[1]
+                all_detections.append(detections)
+        
+        return all_detections
+    
+    def _downscale(self, frame: np.ndarray) -> Tuple[np.ndarray, Optional[Tuple[float, float]]]:
+        """
+        Shrink a frame so its longer side is the inference size
+        
+        Ultralytics would letterbox-resize it on the CPU anyway; doing it 
+        here lets the resize run through cv2.UMat on an OpenCL device.
+        
+        Args:
+            frame: Full-resolution BGR frame
+            
+        Returns:
+            (frame to infer on, (x_scale, y_scale) back to the original 
+            size, or None if the frame was not resized)
+        """
+        height, width = frame.shape[:2]
+        ratio = self.imgsz / max(height, width)
+        if ratio >= 1:
+            return frame, None
+        
+        size = (round(width * ratio), round(height * ratio))
+        if self.use_opencl:
+            resized = cv2.resize(cv2.UMat(frame), size, interpolation=cv2.INTER_LINEAR).get()
+        else:
+            resized = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+        
+        return resized, (width / size[0], height / size[1])
@@ -4,6 +4,16 @@ Example usage script demonstrating the Bird Counting API
 import requests
 from pathlib import Path
 import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection-pooled session with retries, shared by every API call
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                                     max_retries=Retry(total=3, backoff_factor=0.3)))
+
+# Connect timeout, read timeout (analysis can take minutes)
+TIMEOUT = (5, 300)
 
 
 def analyze_video_example():
@@ -37,7 +47,7 @@ def analyze_video_example():
         print("Please wait, this may take a few minutes...\n")
         
         # Send request
-        response = requests.post(api_url, files=files, data=params)
+        response = session.post(api_url, files=files, data=params, timeout=TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
@@ -88,7 +98,7 @@ if __name__ == "__main__":
     
     # Check if server is running
     try:
-        health_response = requests.get("http://localhost:8000/health")
+        health_response = session.get("http://localhost:8000/health", timeout=TIMEOUT)
         if health_response.status_code == 200:
             print("✓ API server is running\n")
             analyze_video_example()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+One-time deployment step: place YOLO weights in MODELS_DIR and, on CUDA
+hosts, export a TensorRT FP16 engine next to them.
+
+BirdDetector loads the engine when present, otherwise the pre-placed
+weights, so servers never download or convert the model at startup.
+
+Usage:
+    python export_once.py
+"""
+import shutil
+import logging
+
+import torch
+from ultralytics import YOLO
+
+from config import YOLO_MODEL, YOLO_MODEL_PATH, YOLO_ENGINE_PATH, DEFAULT_BATCH_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """Pre-place weights and export the TensorRT engine"""
+    if not YOLO_MODEL_PATH.exists():
+        # Loading by name uses a local copy or downloads it
+        model = YOLO(YOLO_MODEL)
+        shutil.copy(model.ckpt_path, YOLO_MODEL_PATH)
+        logger.info(f"Weights placed at {YOLO_MODEL_PATH}")
+    
+    if not torch.cuda.is_available():
+        logger.info("CUDA not available, skipping TensorRT engine export")
+        return
+    
+    if YOLO_ENGINE_PATH.exists():
+        logger.info(f"Engine already exported: {YOLO_ENGINE_PATH}")
+        return
+    
+    # Dynamic batch so detect_batch() can send up to DEFAULT_BATCH_SIZE frames
+    engine_path = YOLO(str(YOLO_MODEL_PATH)).export(
+        format='engine', half=True, imgsz=640, 
+        dynamic=True, batch=DEFAULT_BATCH_SIZE, device=0
+    )
+    logger.info(f"TensorRT engine exported to {engine_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,26 @@
 FastAPI application for bird counting and weight estimation
 """
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import os
 import shutil
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import tempfile
 import logging
 import json
 
+from detector import BirdDetector
 from video_processor import VideoProcessor
 from weight_estimator import WeightEstimator
-from utils import save_json_output, create_output_filename
-from config import OUTPUT_DIR, API_HOST, API_PORT, DEFAULT_CONF_THRESH, DEFAULT_IOU_THRESH, DEFAULT_FPS_SAMPLE
+from utils import save_json_output, create_output_filename, iter_json_chunks, dumps_json
+from config import OUTPUT_DIR, API_HOST, API_PORT, API_WORKERS, DEV_MODE, DEFAULT_CONF_THRESH, DEFAULT_IOU_THRESH, DEFAULT_FPS_SAMPLE, UPLOAD_CHUNK_SIZE, UPLOAD_TO_MEMORY, MAX_UPLOAD_SIZE, PROCESS_WORKERS, STREAM_RESPONSE_MIN_TRACKS
 
 # Configure logging
 logging.basicConfig(
@@ -23,13 +30,189 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when installed (NumPy values allowed)"""
+    
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Bird Counting and Weight Estimation API",
     description="Analyze poultry CCTV videos for bird counting and weight estimation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# Per-process detector, loaded and warmed up once in each worker process
+DETECTOR: Optional[BirdDetector] = None
+
+# Video processing runs in worker processes so CPU/GPU-heavy work neither
+# blocks the event loop nor serializes concurrent uploads
+executor: Optional[ProcessPoolExecutor] = None
+
+
+def _init_worker():
+    """Load the YOLO model once per worker process and run a warm-up inference"""
+    global DETECTOR
+    DETECTOR = BirdDetector()
+    DETECTOR.warmup()
+
+
+def _ping_worker() -> int:
+    """No-op task used to start worker processes at startup"""
+    return os.getpid()
+
+
+@functools.lru_cache(maxsize=8)
+def get_processor(conf_thresh: float, iou_thresh: float) -> VideoProcessor:
+    """Reuse one processor per threshold pair within a worker process"""
+    return VideoProcessor(conf_thresh=conf_thresh, iou_thresh=iou_thresh, 
+                          detector=DETECTOR)
+
+
+def _process_video_worker(video_path: str, fps_sample: int, conf_thresh: float, 
+                          iou_thresh: float, annotated_output_path: Optional[str],
+                          tracks_json_path: Optional[str]) -> Dict:
+    """
+    Run the video pipeline, weight estimation and the tracks JSON export 
+    inside a worker process with its warm detector
+    
+    Returns:
+        process_video() results plus 'weight_estimates'
+    """
+    # process_video() resets the cached processor's tracker itself
+    processor = get_processor(conf_thresh, iou_thresh)
+    results = processor.process_video(
+        video_path, 
+        fps_sample=fps_sample,
+        annotated_output_path=annotated_output_path
+    )
+    
+    # Estimate weights
+    logger.info("Estimating weights...")
+    weight_estimator = WeightEstimator()
+    results['weight_estimates'] = weight_estimator.estimate_weights(results['tracks'])
+    
+    # Save tracks to JSON
+    if tracks_json_path is not None:
+        tracks_data = {
+            'counts': results['counts'],
+            'tracks': results['tracks'],
+            'weight_estimates': results['weight_estimates'],
+            'video_info': results['video_info']
+        }
+        save_json_output(tracks_data, tracks_json_path)
+    
+    return results
+
+
+def _upload_too_large() -> HTTPException:
+    """413 error for uploads larger than MAX_UPLOAD_SIZE"""
+    return HTTPException(
+        status_code=413, 
+        detail=f"Video exceeds the {MAX_UPLOAD_SIZE // (1024 * 1024)} MB upload limit"
+    )
+
+
+def _copy_upload_to_tempfile(video: UploadFile) -> str:
+    """Write the uploaded video to a named temporary file (blocking)"""
+    total = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(video.filename).suffix) as temp_file:
+        try:
+            while True:
+                chunk = video.file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > MAX_UPLOAD_SIZE:
+                    raise _upload_too_large()
+                temp_file.write(chunk)
+        except Exception:
+            temp_file.close()
+            os.unlink(temp_file.name)
+            raise
+    return temp_file.name
+
+
+async def _save_upload(video: UploadFile) -> Tuple[str, Optional[int]]:
+    """
+    Store the uploaded video where OpenCV (in a worker process) can open it
+    
+    On Linux the upload is copied into an anonymous RAM-backed memfd, exposed 
+    to other processes as /proc/<pid>/fd/<fd>; this saves one disk write 
+    (Starlette has already spooled large uploads to its own temporary file). 
+    Elsewhere it is written to a named temporary file. Neither blocks the 
+    event loop.
+    
+    Returns:
+        (path, fd) where fd is the memfd to close, or None for a temporary file
+        
+    Raises:
+        HTTPException: 413 if the upload is larger than MAX_UPLOAD_SIZE
+    """
+    if UPLOAD_TO_MEMORY and hasattr(os, "memfd_create"):
+        fd = os.memfd_create("upload")
+        total = 0
+        try:
+            while True:
+                chunk = await video.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                # Stop before an oversized upload can exhaust memory
+                total += len(chunk)
+                if total > MAX_UPLOAD_SIZE:
+                    raise _upload_too_large()
+                # Writes to a memfd are memory copies; loop in case of a short write
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(fd, view):]
+        except Exception:
+            os.close(fd)
+            raise
+        return f"/proc/{os.getpid()}/fd/{fd}", fd
+    
+    return await run_in_threadpool(_copy_upload_to_tempfile, video), None
+
+
+def _create_executor() -> ProcessPoolExecutor:
+    """Create the worker pool; each worker loads its detector on start"""
+    # Spawn (not fork) so each worker gets a clean CUDA context
+    return ProcessPoolExecutor(
+        max_workers=PROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    )
+
+
+def _restart_workers(broken: ProcessPoolExecutor):
+    """Replace a broken worker pool (unless another request already did)"""
+    global executor
+    if executor is broken:
+        logger.warning("Worker pool is broken, starting a new one")
+        broken.shutdown(wait=False)
+        executor = _create_executor()
+
+
+@app.on_event("startup")
+async def start_workers():
+    """Start the worker pool and warm up every worker's detector"""
+    global executor
+    executor = _create_executor()
+    # Awaiting the pings re-raises worker start-up failures (e.g. the model 
+    # could not be loaded), so the server fails to start instead of running broken
+    await asyncio.gather(*(asyncio.wrap_future(executor.submit(_ping_worker)) 
+                           for _ in range(PROCESS_WORKERS)))
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    """Shut down the worker pool"""
+    if executor is not None:
+        executor.shutdown()
+
 
 @app.get("/health")
 async def health_check():
@@ -47,7 +230,8 @@ async def analyze_video(
     video: UploadFile = File(..., description="Video file to analyze"),
     fps_sample: Optional[int] = Form(DEFAULT_FPS_SAMPLE, description="Process every Nth frame"),
     conf_thresh: Optional[float] = Form(DEFAULT_CONF_THRESH, description="Detection confidence threshold"),
-    iou_thresh: Optional[float] = Form(DEFAULT_IOU_THRESH, description="IoU threshold for NMS")
+    iou_thresh: Optional[float] = Form(DEFAULT_IOU_THRESH, description="IoU threshold for NMS"),
+    save_artifacts: Optional[bool] = Form(True, description="Write the annotated video and tracks JSON")
 ):
     """
     Analyze video for bird counting and weight estimation
@@ -57,14 +241,16 @@ async def analyze_video(
     - fps_sample: Process every Nth frame (default: 5)
     - conf_thresh: Detection confidence threshold (default: 0.25)
     - iou_thresh: IoU threshold for NMS (default: 0.45)
+    - save_artifacts: Write the annotated video and tracks JSON (default: true)
     
     Returns:
     - counts: Time series of bird counts
     - tracks_sample: Sample tracking data
     - weight_estimates: Weight proxy indices
-    - artifacts: Paths to generated files
+    - artifacts: Paths to generated files (null when save_artifacts is false)
     """
     temp_video_path = None
+    temp_video_fd = None
     
     try:
         # Validate parameters
@@ -75,51 +261,43 @@ async def analyze_video(
         if not (0.0 <= iou_thresh <= 1.0):
             raise HTTPException(status_code=400, detail="iou_thresh must be between 0 and 1")
         
-        # Save uploaded video to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(video.filename).suffix) as temp_file:
-            temp_video_path = temp_file.name
-            shutil.copyfileobj(video.file, temp_file)
+        # Save uploaded video to an in-memory file (Linux) or a temporary file
+        temp_video_path, temp_video_fd = await _save_upload(video)
         
         logger.info(f"Processing video: {video.filename}")
-        logger.info(f"Parameters - fps_sample: {fps_sample}, conf_thresh: {conf_thresh}, iou_thresh: {iou_thresh}")
-        
-        # Initialize video processor
-        processor = VideoProcessor(conf_thresh=conf_thresh, iou_thresh=iou_thresh)
-        
-        # Process video
-        results = processor.process_video(temp_video_path, fps_sample=fps_sample)
+        logger.info(f"Parameters - fps_sample: {fps_sample}, conf_thresh: {conf_thresh}, "
+                    f"iou_thresh: {iou_thresh}, save_artifacts: {save_artifacts}")
         
         # Generate output filenames
-        base_name = Path(video.filename).stem
-        annotated_video_filename = create_output_filename(base_name, "annotated", "mp4")
-        tracks_json_filename = create_output_filename(base_name, "tracks", "json")
-        
-        annotated_video_path = OUTPUT_DIR / annotated_video_filename
-        tracks_json_path = OUTPUT_DIR / tracks_json_filename
+        annotated_video_path = None
+        tracks_json_path = None
+        if save_artifacts:
+            base_name = Path(video.filename).stem
+            annotated_video_filename = create_output_filename(base_name, "annotated", "mp4")
+            tracks_json_filename = create_output_filename(base_name, "tracks", "json")
+            
+            annotated_video_path = OUTPUT_DIR / annotated_video_filename
+            tracks_json_path = OUTPUT_DIR / tracks_json_filename
         
-        # Create annotated video
-        logger.info("Creating annotated video...")
-        processor.create_annotated_video(
-            temp_video_path,
-            results['tracks'],
-            results['counts'],
-            str(annotated_video_path),
-            fps_sample=fps_sample
-        )
+        # Process video, write the annotated video in the same decode pass,
+        # estimate weights and save the tracks JSON, all in a worker process
+        # so the event loop stays responsive
+        loop = asyncio.get_running_loop()
+        pool = executor
+        try:
+            results = await loop.run_in_executor(
+                pool, _process_video_worker,
+                temp_video_path, fps_sample, conf_thresh, iou_thresh, 
+                str(annotated_video_path) if save_artifacts else None,
+                str(tracks_json_path) if save_artifacts else None
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); fail this request but give
+            # the next one a working pool
+            _restart_workers(pool)
+            raise
         
-        # Estimate weights
-        logger.info("Estimating weights...")
-        weight_estimator = WeightEstimator()
-        weight_estimates = weight_estimator.estimate_weights(results['tracks'])
-        
-        # Save tracks to JSON
-        tracks_data = {
-            'counts': results['counts'],
-            'tracks': results['tracks'],
-            'weight_estimates': weight_estimates,
-            'video_info': results['video_info']
-        }
-        save_json_output(tracks_data, tracks_json_path)
+        weight_estimates = results['weight_estimates']
         
         # Sample tracks for response (limit to first 10)
         tracks_sample = []
@@ -138,8 +316,8 @@ async def analyze_video(
             "tracks_sample": tracks_sample,
             "weight_estimates": weight_estimates,
             "artifacts": {
-                "annotated_video": str(annotated_video_path),
-                "tracks_json": str(tracks_json_path)
+                "annotated_video": str(annotated_video_path) if save_artifacts else None,
+                "tracks_json": str(tracks_json_path) if save_artifacts else None
             },
             "video_info": {
                 "filename": video.filename,
@@ -149,15 +327,26 @@ async def analyze_video(
         }
         
         logger.info("Analysis complete")
-        return JSONResponse(content=response)
         
+        # Stream very large replies (per-bird weights grow with track count)
+        # instead of building one big buffer
+        if len(results['tracks']) > STREAM_RESPONSE_MIN_TRACKS:
+            return StreamingResponse(iter_json_chunks(response), media_type="application/json")
+        return FastJSONResponse(content=response)
+        
+    except HTTPException:
+        # Client errors (bad parameters, oversized upload) keep their status
+        raise
+    
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
     
     finally:
         # Clean up temporary file
-        if temp_video_path and os.path.exists(temp_video_path):
+        if temp_video_fd is not None:
+            os.close(temp_video_fd)
+        elif temp_video_path and os.path.exists(temp_video_path):
             os.unlink(temp_video_path)
 
 
@@ -179,10 +368,14 @@ async def root():
 if __name__ == "__main__":
     import uvicorn
     
-    logger.info(f"Starting server on {API_HOST}:{API_PORT}")
+    logger.info(f"Starting server on {API_HOST}:{API_PORT} "
+                f"({'dev reload' if DEV_MODE else f'{API_WORKERS} workers'})")
+    # The reloader forces a single worker, so it is enabled only in dev mode.
+    # uvicorn[standard] picks uvloop/httptools automatically where supported
     uvicorn.run(
         "main:app",
         host=API_HOST,
         port=API_PORT,
-        reload=True
+        reload=DEV_MODE,
+        workers=None if DEV_MODE else API_WORKERS
     )
@@ -13,22 +13,23 @@ def make_dummy_video(output_path: str, width: int = 1280, height: int = 720, fps
     velocities = rng.uniform(low=-3, high=3, size=(num_objs, 2)).astype(np.float32)
     radii = rng.integers(low=15, high=35, size=(num_objs,))
 
+    # Static background and caption are drawn once, then copied into each frame
+    template = np.full((height, width, 3), 40, dtype=np.uint8)  # dark background
+    cv2.putText(template, "Dummy CCTV", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    frame = np.empty_like(template)
+    bounds = np.array([width, height], dtype=np.float32)
+
     for _ in range(num_frames):
-        frame = np.zeros((height, width, 3), dtype=np.uint8)
-        frame[:] = (40, 40, 40)  # dark background
+        np.copyto(frame, template)
 
-        for i in range(num_objs):
-            centers[i] += velocities[i]
-            # bounce off walls
-            if centers[i][0] < radii[i] or centers[i][0] > width - radii[i]:
-                velocities[i][0] *= -1
-            if centers[i][1] < radii[i] or centers[i][1] > height - radii[i]:
-                velocities[i][1] *= -1
+        # Move all objects and bounce off walls in one step
+        centers += velocities
+        bounce = (centers < radii[:, None]) | (centers > bounds - radii[:, None])
+        velocities[bounce] *= -1
 
-            cv2.circle(frame, (int(centers[i][0]), int(centers[i][1])), int(radii[i]), (0, 255, 255), -1)
+        for (cx, cy), r in zip(centers.astype(int), radii):
+            cv2.circle(frame, (int(cx), int(cy)), int(r), (0, 255, 255), -1)
 
-        # Overlay timestamp
-        cv2.putText(frame, "Dummy CCTV", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
         writer.write(frame)
 
     writer.release()
@@ -6,6 +6,16 @@ import requests
 import json
 import sys
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Pooled session so repeated calls reuse the same connection
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                                     max_retries=Retry(total=3, backoff_factor=0.3)))
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 300)
 
 
 def test_health():
@@ -15,7 +25,7 @@ def test_health():
     print("="*60)
     
     try:
-        response = requests.get("http://localhost:8000/health")
+        response = session.get("http://localhost:8000/health", timeout=TIMEOUT)
         response.raise_for_status()
         
         data = response.json()
@@ -53,11 +63,11 @@ def test_analyze_video(video_path: str):
                 'iou_thresh': 0.45
             }
             
-            response = requests.post(
+            response = session.post(
                 "http://localhost:8000/analyze_video",
                 files=files,
                 data=data,
-                timeout=300  # 5 minutes timeout
+                timeout=TIMEOUT  # 5 minutes read timeout
             )
             response.raise_for_status()
             
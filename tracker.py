@@ -1,12 +1,13 @@
 """
 ByteTrack implementation for bird tracking
 """
+import heapq
 import numpy as np
-from typing import List, Dict, Tuple
-from collections import defaultdict
+from scipy.optimize import linear_sum_assignment
+from typing import Dict, Tuple
 import logging
 
-from utils import calculate_iou
+from utils import iou_matrix
 
 logger = logging.getLogger(__name__)
 
@@ -15,9 +16,15 @@ class ByteTracker:
     """
     Simple ByteTrack implementation for object tracking.
     Handles stable ID assignment, occlusions, and ID switches.
+    
+    Track state is kept as a structure of arrays: one preallocated NumPy
+    array per field, indexed by slot. Slots of dead tracks are recycled
+    through a free-list, so matching reads boxes straight out of
+    ``self._boxes`` without per-track allocations.
     """
     
-    def __init__(self, track_thresh: float = 0.5, track_buffer: int = 30, match_thresh: float = 0.7):
+    def __init__(self, track_thresh: float = 0.5, track_buffer: int = 30, match_thresh: float = 0.7,
+                 capacity: int = 256):
         """
         Initialize ByteTracker
         
@@ -25,149 +32,182 @@ class ByteTracker:
             track_thresh: Confidence threshold for high confidence tracks
             track_buffer: Maximum frames to keep track alive without detection
             match_thresh: IoU threshold for matching detections to tracks
+            capacity: Initial number of track slots (grows on demand)
         """
         self.track_thresh = track_thresh
         self.track_buffer = track_buffer
         self.match_thresh = match_thresh
         
-        self.tracks: Dict = {}
+        self._capacity = capacity
+        self._boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self._confs = np.zeros(capacity, dtype=np.float32)
+        self._ages = np.zeros(capacity, dtype=np.int32)
+        self._hits = np.zeros(capacity, dtype=np.int32)
+        self._start_frames = np.zeros(capacity, dtype=np.int32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._free_slots = list(range(capacity))  # min-heap of free slots
+        
         self.next_id = 1
         self.frame_count = 0
-        
-    def update(self, detections: List[List]) -> List[List]:
+    
+    def reset(self):
+        """Drop all tracks and restart IDs at 1, keeping the allocated slots"""
+        self._active[:] = False
+        self._free_slots = list(range(self._capacity))
+        self.next_id = 1
+        self.frame_count = 0
+    
+    @property
+    def tracks(self) -> Dict[int, Dict]:
+        """Dict-shaped view of the active tracks (built on demand, e.g. for JSON output)"""
+        return {
+            int(self._ids[slot]): {
+                'box': self._boxes[slot].tolist(),
+                'confidence': float(self._confs[slot]),
+                'age': int(self._ages[slot]),
+                'hits': int(self._hits[slot]),
+                'start_frame': int(self._start_frames[slot])
+            }
+            for slot in self._active_slots()
+        }
+    
+    def update(self, detections: np.ndarray) -> np.ndarray:
         """
         Update tracks with new detections
         
         Args:
-            detections: List of [x1, y1, x2, y2, confidence]
-            
+            detections: (N, 5) array of [x1, y1, x2, y2, confidence]
+        
         Returns:
-            List of [x1, y1, x2, y2, track_id]
+            Array of [x1, y1, x2, y2, track_id] rows
         """
         self.frame_count += 1
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 5)
         
         if len(detections) == 0:
             # Age existing tracks and remove dead tracks
-            dead_tracks = []
-            for track_id in self.tracks:
-                self.tracks[track_id]['age'] += 1
-                if self.tracks[track_id]['age'] > self.track_buffer:
-                    dead_tracks.append(track_id)
-            for track_id in dead_tracks:
-                del self.tracks[track_id]
-            return []
+            self._ages[self._active] += 1
+            self._remove_dead_tracks()
+            return np.zeros((0, 5))
         
         # Separate high and low confidence detections
-        high_conf_dets = [d for d in detections if d[4] >= self.track_thresh]
-        low_conf_dets = [d for d in detections if d[4] < self.track_thresh]
+        high_mask = detections[:, 4] >= self.track_thresh
+        high_conf_dets = detections[high_mask]
+        low_conf_dets = detections[~high_mask]
         
         # Match high confidence detections to existing tracks
-        matched_tracks, unmatched_dets, unmatched_tracks = self._match(
-            high_conf_dets, self.tracks
+        matched_dets, matched_slots, unmatched_dets, unmatched_slots = self._match(
+            high_conf_dets, self._active_slots()
         )
         
         # Update matched tracks
-        for det_idx, track_id in matched_tracks:
-            det = high_conf_dets[det_idx]
-            self.tracks[track_id]['box'] = det[:4]
-            self.tracks[track_id]['confidence'] = det[4]
-            self.tracks[track_id]['age'] = 0
-            self.tracks[track_id]['hits'] += 1
+        self._update_slots(matched_slots, high_conf_dets[matched_dets])
         
         # Try to match low confidence detections to unmatched tracks
-        if len(low_conf_dets) > 0 and len(unmatched_tracks) > 0:
-            unmatched_track_dict = {tid: self.tracks[tid] for tid in unmatched_tracks}
-            matched_tracks_low, _, remaining_unmatched = self._match(
-                low_conf_dets, unmatched_track_dict
+        if len(low_conf_dets) > 0 and len(unmatched_slots) > 0:
+            matched_dets_low, matched_slots_low, _, remaining_unmatched = self._match(
+                low_conf_dets, unmatched_slots
             )
             
-            for det_idx, track_id in matched_tracks_low:
-                det = low_conf_dets[det_idx]
-                self.tracks[track_id]['box'] = det[:4]
-                self.tracks[track_id]['confidence'] = det[4]
-                self.tracks[track_id]['age'] = 0
-                self.tracks[track_id]['hits'] += 1
+            self._update_slots(matched_slots_low, low_conf_dets[matched_dets_low])
             
-            unmatched_tracks = remaining_unmatched
-        
-        # Create new tracks for unmatched high confidence detections
-        for det_idx in unmatched_dets:
-            det = high_conf_dets[det_idx]
-            self.tracks[self.next_id] = {
-                'box': det[:4],
-                'confidence': det[4],
-                'age': 0,
-                'hits': 1,
-                'start_frame': self.frame_count
-            }
-            self.next_id += 1
+            unmatched_slots = remaining_unmatched
         
         # Age unmatched tracks
-        for track_id in unmatched_tracks:
-            self.tracks[track_id]['age'] += 1
+        self._ages[unmatched_slots] += 1
+        
+        # Create new tracks for unmatched high confidence detections
+        for det in high_conf_dets[unmatched_dets]:
+            self._add_track(det)
         
         # Remove dead tracks
-        dead_tracks = [tid for tid, t in self.tracks.items() 
-                      if t['age'] > self.track_buffer]
-        for track_id in dead_tracks:
-            del self.tracks[track_id]
-        
-        # Return active tracks
-        results = []
-        for track_id, track in self.tracks.items():
-            if track['age'] == 0:  # Only return tracks updated this frame
-                box = track['box']
-                results.append([box[0], box[1], box[2], box[3], track_id])
-        
-        return results
+        self._remove_dead_tracks()
+        
+        # Return active tracks, only those updated this frame
+        updated = np.flatnonzero(self._active & (self._ages == 0))
+        updated = updated[np.argsort(self._ids[updated])]
+        
+        return np.hstack([self._boxes[updated], self._ids[updated, None]])
+    
+    def _active_slots(self) -> np.ndarray:
+        """Slots currently holding a live track"""
+        return np.flatnonzero(self._active)
+    
+    def _update_slots(self, slots: np.ndarray, dets: np.ndarray):
+        """Refresh matched tracks (distinct slots) with their new detections"""
+        self._boxes[slots] = dets[:, :4]
+        self._confs[slots] = dets[:, 4]
+        self._ages[slots] = 0
+        self._hits[slots] += 1
+    
+    def _add_track(self, det: np.ndarray):
+        """Start a new track in the lowest free slot"""
+        if not self._free_slots:
+            self._grow()
+        
+        slot = heapq.heappop(self._free_slots)
+        self._boxes[slot] = det[:4]
+        self._confs[slot] = det[4]
+        self._ages[slot] = 0
+        self._hits[slot] = 1
+        self._start_frames[slot] = self.frame_count
+        self._ids[slot] = self.next_id
+        self._active[slot] = True
+        self.next_id += 1
+    
+    def _remove_dead_tracks(self):
+        """Free the slots of tracks unseen for more than track_buffer frames"""
+        dead = np.flatnonzero(self._active & (self._ages > self.track_buffer))
+        self._active[dead] = False
+        for slot in dead:
+            heapq.heappush(self._free_slots, int(slot))
     
-    def _match(self, detections: List, tracks: Dict) -> Tuple[List, List, List]:
+    def _grow(self):
+        """Double the slot capacity"""
+        old_capacity = self._capacity
+        self._capacity *= 2
+        
+        for name in ('_boxes', '_confs', '_ages', '_hits', '_start_frames', '_ids', '_active'):
+            old = getattr(self, name)
+            new = np.zeros((self._capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:old_capacity] = old
+            setattr(self, name, new)
+        
+        for slot in range(old_capacity, self._capacity):
+            heapq.heappush(self._free_slots, slot)
+    
+    def _match(self, detections: np.ndarray, 
+               slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         """
         Match detections to tracks using IoU
         
         Returns:
-            matched: List of (det_idx, track_id) pairs
-            unmatched_dets: List of unmatched detection indices
-            unmatched_tracks: List of unmatched track IDs
+            matched_dets: Indices of matched detections
+            matched_slots: Track slot matched to each of matched_dets
+            unmatched_dets: Indices of unmatched detections
+            unmatched_slots: Array of unmatched track slots
         """
-        if len(detections) == 0 or len(tracks) == 0:
-            return [], list(range(len(detections))), list(tracks.keys())
+        if len(detections) == 0 or len(slots) == 0:
+            no_match = np.zeros(0, dtype=np.intp)
+            return no_match, no_match, np.arange(len(detections)), slots
         
         # Compute IoU matrix
-        iou_matrix = np.zeros((len(detections), len(tracks)))
-        track_ids = list(tracks.keys())
-        
-        for i, det in enumerate(detections):
-            for j, track_id in enumerate(track_ids):
-                iou_matrix[i, j] = calculate_iou(
-                    np.array(det[:4]), 
-                    np.array(tracks[track_id]['box'])
-                )
-        
-        # Greedy matching
-        matched = []
-        unmatched_dets = list(range(len(detections)))
-        unmatched_tracks = track_ids.copy()
-        
-        while len(unmatched_dets) > 0 and len(unmatched_tracks) > 0:
-            # Find maximum IoU
-            max_iou = 0
-            max_det = -1
-            max_track = -1
-            
-            for i in unmatched_dets:
-                for j, tid in enumerate(unmatched_tracks):
-                    track_idx = track_ids.index(tid)
-                    if iou_matrix[i, track_idx] > max_iou:
-                        max_iou = iou_matrix[i, track_idx]
-                        max_det = i
-                        max_track = tid
-            
-            if max_iou < self.match_thresh:
-                break
-            
-            matched.append((max_det, max_track))
-            unmatched_dets.remove(max_det)
-            unmatched_tracks.remove(max_track)
+        ious = iou_matrix(detections[:, :4], self._boxes[slots])
+        
+        # Globally optimal assignment (maximize total IoU), then drop
+        # pairs that do not overlap enough
+        det_rows, track_cols = linear_sum_assignment(-ious)
+        keep = ious[det_rows, track_cols] >= self.match_thresh
+        det_rows, track_cols = det_rows[keep], track_cols[keep]
+        
+        # Mark matched rows/columns by position instead of searching lists
+        det_unmatched = np.ones(len(detections), dtype=bool)
+        det_unmatched[det_rows] = False
+        track_unmatched = np.ones(len(slots), dtype=bool)
+        track_unmatched[track_cols] = False
+        
+        unmatched_dets = np.flatnonzero(det_unmatched)
+        unmatched_slots = slots[track_unmatched]
         
-        return matched, unmatched_dets, unmatched_tracks
+        return det_rows, slots[track_cols], unmatched_dets, unmatched_slots
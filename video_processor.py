@@ -4,61 +4,180 @@ Video processing pipeline integrating detection, tracking, and weight estimation
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import Dict, List
-from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import decord  # Optional: decodes only the sampled frame indices
+except ImportError:
+    decord = None
 
 from detector import BirdDetector
 from tracker import ByteTracker
 from weight_estimator import WeightEstimator
 from utils import (
     extract_video_metadata,
+    open_video_capture,
+    open_video_writer,
     frame_to_timestamp,
+    sampled_frame_timestamps,
     generate_color_for_id,
     draw_bbox_with_label,
     draw_count_overlay
 )
-from config import VIDEO_CODEC, OUTPUT_FPS
+from config import (
+    OUTPUT_FPS, DEFAULT_BATCH_SIZE, 
+    PIPELINE_PREFETCH_BATCHES, PIPELINE_QUEUE_SIZE,
+    RENDER_WORKERS, RENDER_QUEUE_SIZE
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _put_unless_stopped(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put item on a bounded queue, giving up if stop is set while waiting"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class _TrackHistory:
+    """
+    Per-observation track history stored as one growable array per field
+    
+    Each processed frame appends its tracks with a single slice assignment;
+    observations are grouped into per-track lists only once, in to_dict().
+    """
+    
+    def __init__(self, capacity: int = 4096):
+        self.size = 0
+        self._boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self._confs = np.zeros(capacity, dtype=np.float32)
+        self._frames = np.zeros(capacity, dtype=np.int64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+    
+    def append(self, frame_idx: int, tracks: np.ndarray, confidences):
+        """
+        Record one frame's tracks
+        
+        Args:
+            frame_idx: Index of the frame in the video
+            tracks: (K, 5) array of [x1, y1, x2, y2, track_id]
+            confidences: K detection confidences
+        """
+        n = len(tracks)
+        if self.size + n > len(self._ids):
+            self._grow(self.size + n)
+        
+        rows = slice(self.size, self.size + n)
+        self._boxes[rows] = tracks[:, :4]
+        self._ids[rows] = tracks[:, 4]
+        self._confs[rows] = confidences
+        self._frames[rows] = frame_idx
+        self.size += n
+    
+    @property
+    def num_tracks(self) -> int:
+        return len(np.unique(self._ids[:self.size]))
+    
+    def to_dict(self) -> Dict[int, Dict]:
+        """
+        Group observations by track ID (ascending) in frame order
+        
+        Returns:
+            {track_id: {'boxes', 'confidences', 'frames'}} where each value is 
+            a view into one array per field: (n, 4) float32 boxes, (n,) 
+            float32 confidences and (n,) int64 frame indices. They are 
+            serialized straight from NumPy (orjson), never boxed as Python floats.
+        """
+        ids = self._ids[:self.size]
+        order = np.argsort(ids, kind='stable')
+        unique_ids, starts = np.unique(ids[order], return_index=True)
+        bounds = np.append(starts, len(order)).tolist()
+        
+        boxes = self._boxes[order]
+        confs = self._confs[order]
+        frames = self._frames[order]
+        
+        return {
+            track_id: {
+                'boxes': boxes[start:end],
+                'confidences': confs[start:end],
+                'frames': frames[start:end]
+            }
+            for track_id, start, end in zip(unique_ids.tolist(), bounds[:-1], bounds[1:])
+        }
+    
+    def _grow(self, min_capacity: int):
+        """Double the capacity until min_capacity rows fit"""
+        capacity = len(self._ids)
+        while capacity < min_capacity:
+            capacity *= 2
+        
+        for name in ('_boxes', '_confs', '_frames', '_ids'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+
 class VideoProcessor:
     """
     Main video processing pipeline for bird counting and weight estimation
     """
     
-    def __init__(self, conf_thresh: float = 0.25, iou_thresh: float = 0.45):
+    def __init__(self, conf_thresh: float = 0.25, iou_thresh: float = 0.45,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 detector: Optional[BirdDetector] = None):
         """
         Initialize video processor
         
         Args:
             conf_thresh: Detection confidence threshold
             iou_thresh: IoU threshold for NMS
+            batch_size: Number of sampled frames per detector forward pass
+            detector: Preloaded (warm) detector to share; a new one is created if omitted
         """
         self.conf_thresh = conf_thresh
         self.iou_thresh = iou_thresh
+        self.batch_size = batch_size
+        self.detector = detector or BirdDetector(conf_thresh, iou_thresh)
+        self.tracker = ByteTracker(track_thresh=conf_thresh, 
+                                   track_buffer=30, match_thresh=0.7)
+        
+    def reset_tracker(self):
+        """Clear tracker state for the next video, keeping the loaded detector"""
+        self.tracker.reset()
         
-    def process_video(self, video_path: str, fps_sample: int = 5) -> Dict:
+    def process_video(self, video_path: str, fps_sample: int = 5, 
+                      annotated_output_path: Optional[str] = None) -> Dict:
         """
         Process video and return tracking results
         
         Args:
             video_path: Path to input video
             fps_sample: Process every Nth frame
+            annotated_output_path: If given, write the annotated video here 
+                during the same decode pass
             
         Returns:
-            Dictionary containing counts, tracks, and metadata
+            Dictionary containing counts, tracks (per-track NumPy arrays), 
+            and metadata
         """
         logger.info(f"Processing video: {video_path}")
         
-        # Initialize components
-        detector = BirdDetector(self.conf_thresh, self.iou_thresh)
-        tracker = ByteTracker(track_thresh=self.conf_thresh, 
-                            track_buffer=30, match_thresh=0.7)
+        # Track IDs must not carry over from a previous video
+        self.reset_tracker()
         
         # Open video
-        cap = cv2.VideoCapture(video_path)
+        cap = open_video_capture(video_path)
         if not cap.isOpened():
             raise ValueError(f"Could not open video: {video_path}")
         
@@ -69,75 +188,106 @@ class VideoProcessor:
         logger.info(f"Video: {total_frames} frames at {fps} FPS")
         logger.info(f"Processing every {fps_sample} frame(s)")
         
+        # Annotated frames are written as they are tracked, so the video 
+        # is decoded only once
+        out = None
+        if annotated_output_path is not None:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            out = open_video_writer(annotated_output_path, fps / fps_sample, 
+                                    (width, height))
+        
+        # Overlay/count timestamps for all sampled frames, formatted up front
+        timestamps = sampled_frame_timestamps(total_frames, fps, fps_sample)
+        
         # Storage for results
         counts = []
-        all_tracks = defaultdict(lambda: {
-            'boxes': [],
-            'confidences': [],
-            'frames': []
-        })
+        all_tracks = _TrackHistory()
         
-        frame_idx = 0
         processed_frames = 0
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Sample frames
-            if frame_idx % fps_sample == 0:
-                # Detect birds
-                detections = detector.detect(frame)
-                
-                # Update tracker
-                tracks = tracker.update(detections)
-                
-                # Count birds
-                bird_count = len(tracks)
-                
-                # Calculate timestamp
-                timestamp = frame_to_timestamp(frame_idx, fps)
+        # Three-stage pipeline: a reader thread decodes ahead while this
+        # thread detects/tracks, and a writer thread aggregates results and
+        # encodes the annotated video. Bounded queues give back-pressure.
+        stop = threading.Event()
+        writer_errors = []
+        read_q = queue.Queue(maxsize=PIPELINE_PREFETCH_BATCHES)
+        write_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        
+        reader = threading.Thread(
+            target=self._read_stage, 
+            args=(cap, video_path, fps_sample, read_q, stop), 
+            daemon=True
+        )
+        writer = threading.Thread(
+            target=self._write_stage, 
+            args=(write_q, fps, fps_sample, timestamps, counts, all_tracks, 
+                  out, writer_errors), 
+            daemon=True
+        )
+        reader.start()
+        writer.start()
+        
+        try:
+            while True:
+                item = read_q.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if writer_errors:
+                    # Writing failed (e.g. encoder died, disk full): stop 
+                    # decoding and detecting, the error is raised below
+                    break
+                batch_indices, batch_frames = item
                 
-                counts.append({
-                    'timestamp': timestamp,
-                    'count': bird_count,
-                    'frame': frame_idx
-                })
+                # Detect birds
+                batch_detections = self.detector.detect_batch(
+                    batch_frames, self.batch_size, 
+                    conf_thresh=self.conf_thresh, iou_thresh=self.iou_thresh
+                )
                 
-                # Store track information
-                for track in tracks:
-                    track_id = int(track[4])
-                    box = track[:4].tolist()
+                # Tracker state is sequential, so update in frame order
+                for sampled_idx, sampled_frame, detections in zip(
+                        batch_indices, batch_frames, batch_detections):
+                    # Update tracker
+                    tracks = self.tracker.update(detections)
                     
-                    # Find confidence from original detection
-                    conf = 0.0
-                    for det in detections:
-                        det_box = np.array(det[:4])
-                        track_box = np.array(box)
-                        if np.allclose(det_box, track_box, atol=1.0):
-                            conf = det[4]
-                            break
+                    # Count birds
+                    bird_count = len(tracks)
                     
-                    all_tracks[track_id]['boxes'].append(box)
-                    all_tracks[track_id]['confidences'].append(float(conf))
-                    all_tracks[track_id]['frames'].append(frame_idx)
-                
-                processed_frames += 1
-                
-                if processed_frames % 30 == 0:
-                    logger.info(f"Processed {processed_frames} frames, current count: {bird_count}")
+                    # Find confidence of each track from original detection
+                    confidences = self._match_confidences(tracks, detections)
+                    
+                    write_q.put((sampled_idx, sampled_frame, tracks, confidences))
+                    
+                    processed_frames += 1
+                    
+                    if processed_frames % 30 == 0:
+                        logger.info(f"Processed {processed_frames} frames, current count: {bird_count}")
+        finally:
+            # Unblock the reader if we stopped early, then drain the writer
+            stop.set()
+            write_q.put(None)
+            writer.join()
+            reader.join()
             
-            frame_idx += 1
+            cap.release()
+            if out is not None:
+                out.release()
+        
+        if writer_errors:
+            raise writer_errors[0]
         
-        cap.release()
+        if out is not None:
+            logger.info(f"Annotated video saved to {annotated_output_path}")
         
         logger.info(f"Processing complete: {processed_frames} frames processed")
-        logger.info(f"Total unique tracks: {len(all_tracks)}")
+        logger.info(f"Total unique tracks: {all_tracks.num_tracks}")
         
         return {
             'counts': counts,
-            'tracks': dict(all_tracks),
+            'tracks': all_tracks.to_dict(),
             'video_info': {
                 'fps': fps,
                 'total_frames': total_frames,
@@ -145,6 +295,159 @@ class VideoProcessor:
             }
         }
     
+    @staticmethod
+    def _match_confidences(tracks: np.ndarray, detections: np.ndarray) -> np.ndarray:
+        """
+        Look up each track's detection confidence in one vectorized pass
+        
+        A track takes the confidence of the first detection whose box 
+        coordinates all lie within 1 pixel of the track box (0 if none).
+        
+        Args:
+            tracks: (T, 5) array of [x1, y1, x2, y2, track_id]
+            detections: (D, 5) array of [x1, y1, x2, y2, confidence]
+            
+        Returns:
+            (T,) float32 array of confidences
+        """
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 5)
+        confidences = np.zeros(len(tracks), dtype=np.float32)
+        if len(tracks) == 0 or len(detections) == 0:
+            return confidences
+        
+        # (T, D) max coordinate difference between every track and detection
+        diff = np.abs(tracks[:, None, :4] - detections[None, :, :4]).max(axis=-1)
+        close = diff <= 1.0
+        has_match = close.any(axis=1)
+        first_match = close.argmax(axis=1)
+        confidences[has_match] = detections[first_match[has_match], 4]
+        
+        return confidences
+    
+    @staticmethod
+    def _sampled_timestamp(timestamps: List[str], frame_idx: int, fps: float, 
+                           fps_sample: int) -> str:
+        """
+        Precomputed timestamp of a sampled frame, formatted on the fly if the
+        container under-reported its frame count
+        """
+        sample_idx = frame_idx // fps_sample
+        if sample_idx < len(timestamps):
+            return timestamps[sample_idx]
+        return frame_to_timestamp(frame_idx, fps)
+    
+    def _read_stage(self, cap: cv2.VideoCapture, video_path: str, fps_sample: int, 
+                    read_q: queue.Queue, stop: threading.Event):
+        """
+        Reader thread: decode sampled frame batches into read_q
+        
+        Ends with a None sentinel; a decode error is forwarded as the 
+        exception object so the consumer can re-raise it.
+        """
+        try:
+            for batch in self._iter_frame_batches(cap, video_path, fps_sample):
+                if not _put_unless_stopped(read_q, batch, stop):
+                    return
+        except Exception as e:
+            _put_unless_stopped(read_q, e, stop)
+        finally:
+            _put_unless_stopped(read_q, None, stop)
+    
+    def _write_stage(self, write_q: queue.Queue, fps: float, fps_sample: int, 
+                     timestamps: List[str], counts: List[Dict], all_tracks: _TrackHistory, 
+                     out: Optional[cv2.VideoWriter], errors: List):
+        """
+        Writer thread: record counts/tracks and write annotated frames
+        
+        Consumes (frame_idx, frame, tracks, confidences) items until a None 
+        sentinel. After an error it keeps draining so the producer never blocks.
+        """
+        while True:
+            item = write_q.get()
+            if item is None:
+                break
+            if errors:
+                continue
+            
+            try:
+                sampled_idx, sampled_frame, tracks, confidences = item
+                
+                # Look up timestamp
+                timestamp = self._sampled_timestamp(timestamps, sampled_idx, fps, fps_sample)
+                
+                counts.append({
+                    'timestamp': timestamp,
+                    'count': len(tracks),
+                    'frame': sampled_idx
+                })
+                
+                # Store track information
+                all_tracks.append(sampled_idx, tracks, confidences)
+                
+                if out is not None:
+                    out.write(self._annotate_frame(
+                        sampled_frame, tracks[:, 4].astype(np.int64), tracks[:, :4], 
+                        confidences, len(tracks), timestamp
+                    ))
+            except Exception as e:
+                errors.append(e)
+    
+    def _iter_frame_batches(self, cap: cv2.VideoCapture, video_path: str, 
+                            fps_sample: int) -> Iterator[Tuple[List[int], List[np.ndarray]]]:
+        """
+        Yield batches of sampled (every fps_sample-th) frames in frame order
+        
+        With decord installed, only the sampled frame indices are decoded; 
+        otherwise frames are read sequentially from the OpenCV capture.
+        
+        Args:
+            cap: Opened capture for the video
+            video_path: Path to input video
+            fps_sample: Process every Nth frame
+            
+        Yields:
+            (frame_indices, frames) with up to batch_size BGR frames
+        """
+        if decord is not None:
+            reader = decord.VideoReader(video_path, ctx=decord.cpu(0))
+            sampled = list(range(0, len(reader), fps_sample))
+            
+            for start in range(0, len(sampled), self.batch_size):
+                indices = sampled[start:start + self.batch_size]
+                # decord returns RGB; the rest of the pipeline expects BGR
+                frames = [cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) 
+                          for frame in reader.get_batch(indices).asnumpy()]
+                yield indices, frames
+            return
+        
+        frame_idx = 0
+        batch_indices = []
+        batch_frames = []
+        
+        while True:
+            # grab() demuxes/decodes without converting to a BGR array;
+            # only sampled frames are retrieved
+            if not cap.grab():
+                break
+            
+            # Sample frames
+            if frame_idx % fps_sample == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                batch_indices.append(frame_idx)
+                batch_frames.append(frame)
+                
+                if len(batch_frames) == self.batch_size:
+                    yield batch_indices, batch_frames
+                    batch_indices = []
+                    batch_frames = []
+            
+            frame_idx += 1
+        
+        if batch_frames:
+            yield batch_indices, batch_frames
+    
     def create_annotated_video(self, video_path: str, tracks: Dict, 
                               counts: List[Dict], output_path: str, 
                               fps_sample: int = 5):
@@ -160,58 +463,134 @@ class VideoProcessor:
         """
         logger.info("Creating annotated video...")
         
-        cap = cv2.VideoCapture(video_path)
+        cap = open_video_capture(video_path)
         
         fps = cap.get(cv2.CAP_PROP_FPS)
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
-        fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
-        out = cv2.VideoWriter(output_path, fourcc, fps / fps_sample, (width, height))
-        
-        # Create frame-to-tracks mapping
-        frame_tracks = defaultdict(list)
-        for track_id, track_data in tracks.items():
-            for i, frame_idx in enumerate(track_data['frames']):
-                frame_tracks[frame_idx].append({
-                    'id': track_id,
-                    'box': track_data['boxes'][i],
-                    'conf': track_data['confidences'][i]
-                })
+        out = open_video_writer(output_path, fps / fps_sample, (width, height))
+        
+        # Flatten all observations into frame-sorted arrays so each frame's
+        # tracks are a contiguous slice instead of a list of dicts
+        track_ids = list(tracks.keys())
+        lengths = [len(tracks[tid]['frames']) for tid in track_ids]
+        if sum(lengths) > 0:
+            obs_frames = np.concatenate([tracks[tid]['frames'] for tid in track_ids])
+            obs_boxes = np.vstack([np.reshape(tracks[tid]['boxes'], (-1, 4)) for tid in track_ids])
+            obs_confs = np.concatenate([tracks[tid]['confidences'] for tid in track_ids])
+        else:
+            obs_frames = np.zeros(0, dtype=np.int64)
+            obs_boxes = np.zeros((0, 4), dtype=np.float32)
+            obs_confs = np.zeros(0, dtype=np.float32)
+        obs_ids = np.repeat(np.asarray(track_ids, dtype=np.int64), lengths)
+        
+        # Stable sort keeps tracks in insertion order within a frame
+        order = np.argsort(obs_frames, kind='stable')
+        obs_frames = obs_frames[order]
+        obs_boxes = obs_boxes[order]
+        obs_confs = obs_confs[order]
+        obs_ids = obs_ids[order]
         
         # Create frame-to-count mapping
         frame_counts = {c['frame']: c['count'] for c in counts}
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        timestamps = sampled_frame_timestamps(total_frames, fps, fps_sample)
         
-        frame_idx = 0
+        def render(frame: np.ndarray, frame_idx: int) -> np.ndarray:
+            start = np.searchsorted(obs_frames, frame_idx, side='left')
+            end = np.searchsorted(obs_frames, frame_idx, side='right')
+            return self._annotate_frame(
+                frame, obs_ids[start:end], obs_boxes[start:end], obs_confs[start:end],
+                frame_counts.get(frame_idx, 0), 
+                self._sampled_timestamp(timestamps, frame_idx, fps, fps_sample)
+            )
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        # Drawing is independent per frame: a reader thread decodes and hands
+        # frames to a pool of render threads, while this thread writes the
+        # finished frames in order. The bounded queue of pending futures 
+        # keeps decoding from running far ahead of the encoder.
+        stop = threading.Event()
+        render_q = queue.Queue(maxsize=RENDER_QUEUE_SIZE)
+        
+        with ThreadPoolExecutor(max_workers=RENDER_WORKERS) as pool:
+            reader = threading.Thread(
+                target=self._render_read_stage, 
+                args=(cap, fps_sample, pool, render, render_q, stop), 
+                daemon=True
+            )
+            reader.start()
             
-            if frame_idx % fps_sample == 0:
-                # Draw tracks
-                if frame_idx in frame_tracks:
-                    for track in frame_tracks[frame_idx]:
-                        box = track['box']
-                        track_id = track['id']
-                        conf = track['conf']
-                        
-                        # Draw bounding box
-                        color = generate_color_for_id(track_id)
-                        label = f"ID:{track_id} {conf:.2f}"
-                        frame = draw_bbox_with_label(frame, box, label, color)
+            try:
+                while True:
+                    item = render_q.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    out.write(item.result())
+            finally:
+                stop.set()
+                reader.join()
                 
-                # Draw count overlay
-                count = frame_counts.get(frame_idx, 0)
-                timestamp = frame_to_timestamp(frame_idx, fps)
-                frame = draw_count_overlay(frame, count, timestamp)
+                cap.release()
+                out.release()
+        
+        logger.info(f"Annotated video saved to {output_path}")
+    
+    @staticmethod
+    def _render_read_stage(cap: cv2.VideoCapture, fps_sample: int, pool: ThreadPoolExecutor, 
+                           render, render_q: queue.Queue, stop: threading.Event):
+        """
+        Reader thread: decode sampled frames and submit them for rendering
+        
+        Puts one Future per sampled frame on render_q in frame order and ends 
+        with a None sentinel; a decode error is forwarded as the exception object.
+        """
+        try:
+            frame_idx = 0
+            while not stop.is_set():
+                # Skipped frames are grabbed but never retrieved
+                if not cap.grab():
+                    break
                 
-                out.write(frame)
-            
-            frame_idx += 1
+                if frame_idx % fps_sample == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    future = pool.submit(render, frame, frame_idx)
+                    if not _put_unless_stopped(render_q, future, stop):
+                        return
+                
+                frame_idx += 1
+        except Exception as e:
+            _put_unless_stopped(render_q, e, stop)
+        finally:
+            _put_unless_stopped(render_q, None, stop)
+    
+    @staticmethod
+    def _annotate_frame(frame: np.ndarray, track_ids: np.ndarray, boxes: np.ndarray, 
+                        confidences: np.ndarray, count: int, timestamp: str) -> np.ndarray:
+        """
+        Draw tracked boxes and the count/time overlay on a frame
         
-        cap.release()
-        out.release()
+        Args:
+            frame: Frame to draw on (modified in place)
+            track_ids: (K,) track IDs drawn on this frame
+            boxes: (K, 4) boxes as [x1, y1, x2, y2]
+            confidences: (K,) detection confidences
+            count: Bird count for this frame
+            timestamp: Frame timestamp string
+            
+        Returns:
+            Annotated frame
+        """
+        # Draw tracks
+        for track_id, box, conf in zip(track_ids.tolist(), boxes, confidences.tolist()):
+            # Draw bounding box
+            color = generate_color_for_id(track_id)
+            label = f"ID:{track_id} {conf:.2f}"
+            frame = draw_bbox_with_label(frame, box, label, color)
         
-        logger.info(f"Annotated video saved to {output_path}")
+        # Draw count overlay
+        return draw_count_overlay(frame, count, timestamp)
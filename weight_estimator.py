@@ -10,6 +10,21 @@ from utils import calculate_bbox_area
 
 logger = logging.getLogger(__name__)
 
+# Per-observation recency decay exp(-rank * 0.01), tabulated once; 
+# grown on demand for unusually long tracks
+_decay_table = np.exp(-np.arange(4096) * 0.01)
+
+
+def _recency_decay(ranks: np.ndarray) -> np.ndarray:
+    """Look up exp(-rank * 0.01) for non-negative integer ranks"""
+    global _decay_table
+    if len(ranks) and ranks.max() >= len(_decay_table):
+        size = len(_decay_table)
+        while size <= ranks.max():
+            size *= 2
+        _decay_table = np.exp(-np.arange(size) * 0.01)
+    return _decay_table[ranks]
+
 
 class WeightEstimator:
     """
@@ -36,29 +51,30 @@ class WeightEstimator:
             Dictionary with per-bird and aggregate weight estimates
         """
         per_bird_weights = []
-        all_weight_indices = []
         
-        for track_id, track_data in tracks.items():
-            boxes = np.array(track_data['boxes'])
-            confidences = np.array(track_data['confidences'])
-            
-            if len(boxes) == 0:
-                continue
-            
-            # Calculate weight index for this bird
-            weight_index, confidence = self._calculate_weight_index(
-                boxes, confidences
+        track_ids = [tid for tid, data in tracks.items() if len(data['boxes']) > 0]
+        
+        if track_ids:
+            # Calculate weight indices for all birds at once
+            weight_indices, confidences, num_observations = self._calculate_weight_indices(
+                [tracks[tid]['boxes'] for tid in track_ids],
+                [tracks[tid]['confidences'] for tid in track_ids]
             )
             
-            if weight_index > 0:
+            keep = weight_indices > 0
+            for track_id, weight_index, confidence, n_obs in zip(
+                    np.asarray(track_ids)[keep].tolist(), weight_indices[keep].tolist(),
+                    confidences[keep].tolist(), num_observations[keep].tolist()):
                 per_bird_weights.append({
                     'track_id': int(track_id),
-                    'weight_index': float(weight_index),
-                    'confidence': float(confidence),
-                    'num_observations': len(boxes)
+                    'weight_index': weight_index,
+                    'confidence': confidence,
+                    'num_observations': n_obs
                 })
-                
-                all_weight_indices.append(weight_index)
+            
+            all_weight_indices = weight_indices[keep]
+        else:
+            all_weight_indices = []
         
         # Calculate aggregate statistics
         if len(all_weight_indices) > 0:
@@ -103,48 +119,67 @@ class WeightEstimator:
         logger.info(f"Weight estimation complete for {len(per_bird_weights)} birds")
         return result
     
-    def _calculate_weight_index(self, boxes: np.ndarray, 
-                                confidences: np.ndarray) -> Tuple[float, float]:
+    def _calculate_weight_indices(self, boxes_per_track: List, 
+                                  confidences_per_track: List) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Calculate weight index from bounding boxes
+        Calculate weight indices for all tracks in one pass over their 
+        concatenated observations
         
         Args:
-            boxes: Array of [x1, y1, x2, y2] boxes
-            confidences: Array of detection confidences
+            boxes_per_track: Per-track lists/arrays of [x1, y1, x2, y2] boxes
+            confidences_per_track: Per-track lists/arrays of detection confidences
             
         Returns:
-            (weight_index, confidence)
+            (weight_indices, confidences, num_observations) arrays with one 
+            entry per track; the weight index is 0 for tracks with no valid box
         """
+        n_tracks = len(boxes_per_track)
+        lengths = np.array([len(b) for b in boxes_per_track])
+        boxes = np.vstack([np.reshape(b, (-1, 4)) for b in boxes_per_track]).astype(np.float64)
+        confidences = np.concatenate(confidences_per_track).astype(np.float64)
+        track_idx = np.repeat(np.arange(n_tracks), lengths)
+        
         # Calculate areas
         widths = boxes[:, 2] - boxes[:, 0]
         heights = boxes[:, 3] - boxes[:, 1]
         areas = widths * heights
         
         # Filter out very small boxes
-        valid_indices = areas > MIN_BOX_AREA
-        if not np.any(valid_indices):
-            return 0.0, 0.0
+        valid = areas > MIN_BOX_AREA
+        areas = areas[valid]
+        confidences = confidences[valid]
+        track_idx = track_idx[valid]
         
-        areas = areas[valid_indices]
-        confidences = confidences[valid_indices]
+        # Position of each valid observation within its own track
+        valid_counts = np.bincount(track_idx, minlength=n_tracks)
+        track_starts = np.cumsum(valid_counts) - valid_counts
+        ranks = np.arange(len(track_idx)) - track_starts[track_idx]
         
         # Weight by confidence and temporal consistency
         # More recent observations are slightly more important
-        weights = confidences * np.exp(-np.arange(len(confidences)) * 0.01)
-        weights = weights / np.sum(weights)
-        
-        # Weighted mean area
-        mean_area = np.average(areas, weights=weights)
+        weights = confidences * _recency_decay(ranks)
+        
+        # Weighted mean area per track: per-track sum-products, with the 
+        # product taken in place (areas are not needed afterwards)
+        weight_sums = np.bincount(track_idx, weights=weights, minlength=n_tracks)
+        area_sums = np.bincount(track_idx, weights=np.multiply(areas, weights, out=areas), 
+                                minlength=n_tracks)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_areas = np.where(weight_sums > 0, area_sums / weight_sums, 0.0)
+            detection_confidence = np.bincount(
+                track_idx, weights=confidences, minlength=n_tracks
+            ) / valid_counts
         
         # Calculate weight index
-        weight_index = mean_area * self.area_to_weight_factor * self.density_factor
+        weight_indices = mean_areas * self.area_to_weight_factor * self.density_factor
         
         # Confidence based on number of observations and mean confidence
-        observation_confidence = min(1.0, len(boxes) / 30.0)
-        detection_confidence = np.mean(confidences)
-        overall_confidence = (observation_confidence + detection_confidence) / 2
+        observation_confidence = np.minimum(1.0, lengths / 30.0)
+        overall_confidence = np.where(
+            valid_counts > 0, (observation_confidence + detection_confidence) / 2, 0.0
+        )
         
-        return weight_index, overall_confidence
+        return weight_indices, overall_confidence, lengths
     
     def _get_calibration_notes(self) -> str:
         """Get calibration instructions"""
@@ -168,19 +203,22 @@ class WeightEstimator:
         Returns:
             Calibration parameters
         """
-        from sklearn.linear_model import LinearRegression
+        x = np.asarray(weight_indices, dtype=np.float64).ravel()
+        y = np.asarray(actual_weights, dtype=np.float64).ravel()
         
-        model = LinearRegression()
-        X = weight_indices.reshape(-1, 1)
-        y = actual_weights
+        # Least-squares line weight = alpha * index + beta
+        alpha, beta = np.polyfit(x, y, 1)
         
-        model.fit(X, y)
+        # Coefficient of determination
+        ss_res = np.sum((y - (alpha * x + beta)) ** 2)
+        ss_tot = np.sum((y - y.mean()) ** 2)
+        r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else float(ss_res == 0)
         
-        self.calibration_model = model
-        logger.info(f"Calibration: weight = {model.coef_[0]:.4f} * index + {model.intercept_:.4f}")
+        self.calibration_model = (float(alpha), float(beta))
+        logger.info(f"Calibration: weight = {alpha:.4f} * index + {beta:.4f}")
         
         return {
-            'alpha': float(model.coef_[0]),
-            'beta': float(model.intercept_),
-            'r2_score': float(model.score(X, y))
+            'alpha': float(alpha),
+            'beta': float(beta),
+            'r2_score': float(r2)
         }